@@ -2,11 +2,14 @@
 """
 Navi File Uploader - Efficient S3 Upload Script
 Uploads files to AWS S3 bucket with smart duplicate detection
+Files can be fanned out to several destination buckets/regions, reading each file once
 """
 
 import os
 import sys
 import json
+import math
+import queue
 import hashlib
 import threading
 from pathlib import Path
@@ -29,11 +32,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# S3 multipart limits, matching what boto3's transfer manager enforces
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+MAX_PARTS = 10000
+PART_CONCURRENCY = 5  # Parallel part uploads per file and destination
+
 class NaviUploader:
     def __init__(self):
         self.config_file = 'uploader_config.json'
         self.config = self.load_config()
         self.s3_client = None
+        self.destinations = []
+        self.unreachable_destinations = []
+        self.stats_lock = threading.Lock()
         self.upload_stats = {
             'total_files': 0,
             'total_size': 0,
@@ -54,8 +66,13 @@ class NaviUploader:
                 'Z:\\1. DAS Data\\C-12',
                 'Z:\\2. DTC Data'
             ],
+            # Optional list of {'bucket_name', 'aws_region', 'aws_access_key_id', 'aws_secret_access_key'}
+            # targets; only bucket_name is required, the rest default to the settings above.
+            # Empty uses bucket_name/aws_region above
+            'destinations': [],
             'max_workers': 5,
-            'chunk_size': 8 * 1024 * 1024  # 8MB chunks for multipart upload
+            'chunk_size': 8 * 1024 * 1024,  # 8MB chunks for multipart upload
+            'fanout_buffer_parts': 2  # Parts buffered per destination before a slow target blocks reading
         }
         
         if os.path.exists(self.config_file):
@@ -86,48 +103,99 @@ class NaviUploader:
         except Exception as e:
             logger.error("Error saving config: %s", e)
     
+    def get_destinations(self) -> List[Dict]:
+        """Get configured upload destinations, falling back to the single bucket settings"""
+        destinations = self.config.get('destinations') or [{
+            'bucket_name': self.config['bucket_name'],
+            'aws_region': self.config['aws_region']
+        }]
+        
+        resolved = []
+        for destination in destinations:
+            if not destination.get('bucket_name'):
+                logger.error("Skipping destination without bucket_name: %s", destination)
+                continue
+            # Destinations inherit region and credentials unless they override them
+            resolved.append({
+                'bucket_name': destination['bucket_name'],
+                'aws_region': destination.get('aws_region') or self.config['aws_region'],
+                'aws_access_key_id': destination.get('aws_access_key_id') or self.config['aws_access_key_id'],
+                'aws_secret_access_key': destination.get('aws_secret_access_key') or self.config['aws_secret_access_key']
+            })
+        return resolved
+    
+    @staticmethod
+    def destination_label(destination: Dict) -> str:
+        """Human readable name of a destination for logs and messages"""
+        return f"{destination['bucket_name']} ({destination['aws_region']})"
+    
     def setup_aws_client(self) -> bool:
-        """Initialize AWS S3 client with credentials"""
-        try:
-            # Configure connection pool for multi-threading
-            from botocore.config import Config
-            
-            config = Config(
-                region_name=self.config['aws_region'],
-                retries={'max_attempts': 3, 'mode': 'adaptive'},
-                max_pool_connections=100,  # Large pool size for optimal multi-threading
-                signature_version='s3v4'
-            )
-            
-            self.s3_client = boto3.client(
-                's3',
-                aws_access_key_id=self.config['aws_access_key_id'],
-                aws_secret_access_key=self.config['aws_secret_access_key'],
-                config=config
-            )
-            
-            # Test connection
-            self.s3_client.head_bucket(Bucket=self.config['bucket_name'])
-            logger.info("Server connection established successfully")
-            return True
+        """Initialize one pooled AWS S3 client per destination with credentials"""
+        # Configure connection pool for multi-threading
+        from botocore.config import Config
+        
+        self.destinations = []
+        self.unreachable_destinations = []
+        for destination in self.get_destinations():
+            label = self.destination_label(destination)
+            try:
+                config = Config(
+                    region_name=destination['aws_region'],
+                    retries={'max_attempts': 3, 'mode': 'adaptive'},
+                    max_pool_connections=100,  # Large pool size for optimal multi-threading
+                    signature_version='s3v4'
+                )
+                
+                client = boto3.client(
+                    's3',
+                    aws_access_key_id=destination['aws_access_key_id'],
+                    aws_secret_access_key=destination['aws_secret_access_key'],
+                    config=config
+                )
+                
+                # Test connection
+                client.head_bucket(Bucket=destination['bucket_name'])
+                logger.info("Server connection established successfully: %s", label)
+                
+            except NoCredentialsError:
+                logger.error("Server credentials not found: %s", label)
+                self.unreachable_destinations.append(label)
+                continue
+            except ClientError as e:
+                logger.error("Server connection failed for %s: %s", label, e)
+                self.unreachable_destinations.append(label)
+                continue
+            except Exception as e:
+                logger.error("Unexpected error setting up Server %s: %s", label, e)
+                self.unreachable_destinations.append(label)
+                continue
             
-        except NoCredentialsError:
-            logger.error("Server credentials not found")
-            return False
-        except ClientError as e:
-            logger.error("Server connection failed: %s", e)
-            return False
-        except Exception as e:
-            logger.error("Unexpected error setting up Server: %s", e)
+            destination.update({
+                'client': client,
+                'existing_files': set(),
+                'list_failed': False,
+                'uploaded_files': 0,
+                'skipped_files': 0,
+                'failed_files': 0
+            })
+            self.destinations.append(destination)
+        
+        if not self.destinations:
             return False
+        
+        # Primary destination keeps the single-client attribute working
+        self.s3_client = self.destinations[0]['client']
+        return True
     
-    def get_s3_file_list(self) -> Set[str]:
+    def get_s3_file_list(self, destination: Dict = None) -> Set[str]:
         """Get list of existing files in S3 bucket (keys only for security)"""
+        if destination is None:
+            destination = self.destinations[0]
         try:
             existing_files = set()
-            paginator = self.s3_client.get_paginator('list_objects_v2')
+            paginator = destination['client'].get_paginator('list_objects_v2')
             
-            for page in paginator.paginate(Bucket=self.config['bucket_name']):
+            for page in paginator.paginate(Bucket=destination['bucket_name']):
                 if 'Contents' in page:
                     for obj in page['Contents']:
                         existing_files.add(obj['Key'])
@@ -135,7 +203,8 @@ class NaviUploader:
             return existing_files
             
         except Exception as e:
-            logger.error("Error listing S3 files: %s", e)
+            logger.error("Error listing S3 files in %s: %s", self.destination_label(destination), e)
+            destination['list_failed'] = True
             return set()
     
     def calculate_file_hash(self, file_path: str) -> str:
@@ -180,37 +249,197 @@ class NaviUploader:
         logger.info("Files found in directories")
         return local_files
     
-    def upload_file(self, file_path: str, s3_key: str, file_size: int) -> bool:
-        """Upload a single file to S3"""
+    def upload_file(self, file_path: str, s3_key: str, file_size: int, destinations: List[Dict] = None) -> bool:
+        """Upload a single file to every given destination, reading it from disk once"""
+        if destinations is None:
+            destinations = self.destinations
+        
+        if len(destinations) > 1:
+            results = self.fan_out_file(file_path, s3_key, file_size, destinations)
+        else:
+            results = [self.upload_to_destination(file_path, s3_key, file_size, destinations[0])]
+        
+        with self.stats_lock:
+            for destination, success in zip(destinations, results):
+                destination['uploaded_files' if success else 'failed_files'] += 1
+            if any(results):
+                self.upload_stats['uploaded_files'] += 1
+                self.upload_stats['uploaded_size'] += file_size
+        return all(results)
+    
+    def upload_to_destination(self, file_path: str, s3_key: str, file_size: int, destination: Dict) -> bool:
+        """Upload a single file to one S3 destination"""
         try:
             # For large files, use multipart upload
             if file_size > self.config['chunk_size']:
                 # Configure transfer for better connection management
                 transfer_config = boto3.s3.transfer.TransferConfig(
                     multipart_threshold=self.config['chunk_size'],
-                    max_concurrency=5,  # Reduce concurrency to prevent pool overflow
+                    max_concurrency=PART_CONCURRENCY,  # Reduce concurrency to prevent pool overflow
                     multipart_chunksize=self.config['chunk_size'],
                     use_threads=True,
                     max_io_queue=100
                 )
                 
-                self.s3_client.upload_file(
+                destination['client'].upload_file(
                     file_path, 
-                    self.config['bucket_name'], 
+                    destination['bucket_name'], 
                     s3_key,
                     Config=transfer_config
                 )
             else:
-                self.s3_client.upload_file(file_path, self.config['bucket_name'], s3_key)
+                destination['client'].upload_file(file_path, destination['bucket_name'], s3_key)
             
-            self.upload_stats['uploaded_files'] += 1
-            self.upload_stats['uploaded_size'] += file_size
             return True
             
         except Exception as e:
-            logger.error("Error uploading file: %s", e)
+            logger.error("Error uploading file to %s: %s", self.destination_label(destination), e)
             return False
     
+    def fan_out_file(self, file_path: str, s3_key: str, file_size: int, destinations: List[Dict]) -> List[bool]:
+        """Read a file once and stream it to several destinations concurrently"""
+        chunk_size = self.config['chunk_size']
+        
+        with ThreadPoolExecutor(max_workers=len(destinations)) as executor:
+            # Small files are read whole and sent with one request per destination
+            if file_size <= chunk_size:
+                try:
+                    with open(file_path, 'rb') as f:
+                        body = f.read()
+                except Exception as e:
+                    logger.error("Error reading file: %s", e)
+                    return [False] * len(destinations)
+                
+                futures = [
+                    executor.submit(self.put_object_to_destination, body, s3_key, destination)
+                    for destination in destinations
+                ]
+                return [future.result() for future in futures]
+            
+            # Large files are read part by part; each destination gets a bounded queue so a
+            # slow target only holds back reading once its buffer is full
+            part_size = self.get_part_size(file_size)
+            buffer_parts = max(1, self.config['fanout_buffer_parts'])
+            part_queues = [queue.Queue(maxsize=buffer_parts) for _ in destinations]
+            failed_events = [threading.Event() for _ in destinations]
+            futures = [
+                executor.submit(self.stream_parts_to_destination, s3_key, destination, part_queue, failed)
+                for destination, part_queue, failed in zip(destinations, part_queues, failed_events)
+            ]
+            
+            try:
+                with open(file_path, 'rb') as f:
+                    part_number = 1
+                    for chunk in iter(lambda: f.read(part_size), b""):
+                        if all(failed.is_set() for failed in failed_events):
+                            break
+                        for part_queue, failed in zip(part_queues, failed_events):
+                            if not failed.is_set():
+                                part_queue.put((part_number, chunk))
+                        part_number += 1
+            except Exception as e:
+                logger.error("Error reading file: %s", e)
+                for failed in failed_events:
+                    failed.set()
+            finally:
+                # End of file marker; failed destinations abort instead of completing
+                for part_queue in part_queues:
+                    part_queue.put(None)
+            
+            return [future.result() for future in futures]
+    
+    def get_part_size(self, file_size: int) -> int:
+        """Adjust chunk_size to S3's part size limits, like boto3's ChunksizeAdjuster"""
+        part_size = min(max(self.config['chunk_size'], MIN_PART_SIZE), MAX_PART_SIZE)
+        while math.ceil(file_size / part_size) > MAX_PARTS:
+            part_size *= 2
+        return min(part_size, MAX_PART_SIZE)
+    
+    def put_object_to_destination(self, body: bytes, s3_key: str, destination: Dict) -> bool:
+        """Upload an in-memory file body to one S3 destination"""
+        try:
+            destination['client'].put_object(Bucket=destination['bucket_name'], Key=s3_key, Body=body)
+            return True
+        except Exception as e:
+            logger.error("Error uploading file to %s: %s", self.destination_label(destination), e)
+            return False
+    
+    def stream_parts_to_destination(self, s3_key: str, destination: Dict,
+                                    part_queue: queue.Queue, failed: threading.Event) -> bool:
+        """Upload queued file parts to one destination as a multipart upload"""
+        client = destination['client']
+        bucket_name = destination['bucket_name']
+        label = self.destination_label(destination)
+        parts = []
+        parts_lock = threading.Lock()
+        
+        try:
+            upload_id = client.create_multipart_upload(Bucket=bucket_name, Key=s3_key)['UploadId']
+        except Exception as e:
+            logger.error("Error starting file upload to %s: %s", label, e)
+            upload_id = None
+            failed.set()
+        
+        def upload_parts():
+            while True:
+                item = part_queue.get()
+                if item is None:
+                    part_queue.put(None)  # Pass the end of file marker on to the other workers
+                    return
+                if failed.is_set():
+                    continue  # Keep draining so the reader never blocks on a failed destination
+                
+                part_number, chunk = item
+                try:
+                    response = client.upload_part(
+                        Bucket=bucket_name,
+                        Key=s3_key,
+                        UploadId=upload_id,
+                        PartNumber=part_number,
+                        Body=chunk
+                    )
+                    with parts_lock:
+                        parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+                except Exception as e:
+                    logger.error("Error uploading file part to %s: %s", label, e)
+                    failed.set()
+        
+        with ThreadPoolExecutor(max_workers=PART_CONCURRENCY) as executor:
+            for _ in range(PART_CONCURRENCY):
+                executor.submit(upload_parts)
+        
+        if not failed.is_set():
+            try:
+                parts.sort(key=lambda part: part['PartNumber'])
+                client.complete_multipart_upload(
+                    Bucket=bucket_name,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    MultipartUpload={'Parts': parts}
+                )
+                return True
+            except Exception as e:
+                logger.error("Error completing file upload to %s: %s", label, e)
+        
+        if upload_id is not None:
+            try:
+                client.abort_multipart_upload(Bucket=bucket_name, Key=s3_key, UploadId=upload_id)
+            except Exception as e:
+                logger.error("Error aborting file upload to %s: %s", label, e)
+        return False
+    
+    def destination_errors(self) -> List[str]:
+        """Describe destinations that could not be reached, listed or had failed uploads"""
+        errors = [f"{label}: connection failed" for label in self.unreachable_destinations]
+        for destination in self.destinations:
+            if destination['list_failed']:
+                errors.append(f"{self.destination_label(destination)}: "
+                              f"could not check existing files")
+            if destination['failed_files']:
+                errors.append(f"{self.destination_label(destination)}: "
+                              f"{destination['failed_files']} files failed")
+        return errors
+    
     def upload_files(self, progress_callback=None):
         """Main upload function with progress tracking"""
         if not self.setup_aws_client():
@@ -221,26 +450,37 @@ class NaviUploader:
         if not local_files:
             return False, "No files found to upload"
         
-        # Get existing S3 files
+        # Get existing S3 files, checked separately for each destination
         logger.info("Checking existing files on server...")
-        s3_files = self.get_s3_file_list()
+        for destination in self.destinations:
+            destination['existing_files'] = self.get_s3_file_list(destination)
         logger.info("Server file check completed")
         
-        # Filter files that need to be uploaded
+        # Filter files that need to be uploaded, keeping only the destinations missing each file
         files_to_upload = []
         for file_path, s3_key, size in local_files:
-            if s3_key not in s3_files:
-                files_to_upload.append((file_path, s3_key, size))
+            targets = []
+            for destination in self.destinations:
+                if s3_key not in destination['existing_files']:
+                    targets.append(destination)
+                else:
+                    destination['skipped_files'] += 1
+            
+            if targets:
+                files_to_upload.append((file_path, s3_key, size, targets))
             else:
                 self.upload_stats['skipped_files'] += 1
         
         if not files_to_upload:
             logger.info("All files already exist on server")
+            errors = self.destination_errors()
+            if errors:
+                return False, "Some destinations had errors:\n" + '\n'.join(errors)
             return True, "All files are already uploaded"
         
         # Calculate total upload size
         self.upload_stats['total_files'] = len(files_to_upload)
-        self.upload_stats['total_size'] = sum(size for _, _, size in files_to_upload)
+        self.upload_stats['total_size'] = sum(size for _, _, size, _ in files_to_upload)
         
         logger.info("Starting file upload")
         logger.info("Preparing upload tasks...")
@@ -251,8 +491,8 @@ class NaviUploader:
         logger.info("Creating upload threads...")
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             future_to_file = {
-                executor.submit(self.upload_file, file_path, s3_key, size): (file_path, s3_key, size)
-                for file_path, s3_key, size in files_to_upload
+                executor.submit(self.upload_file, file_path, s3_key, size, targets): (file_path, s3_key, size)
+                for file_path, s3_key, size, targets in files_to_upload
             }
             
             logger.info("Upload tasks created, processing files...")
@@ -270,6 +510,11 @@ class NaviUploader:
                 except Exception as e:
                     logger.error("Error in upload task: %s", e)
         
+        errors = self.destination_errors()
+        if errors:
+            logger.error("Uploads completed with errors: %s", '; '.join(errors))
+            return False, "File upload completed with errors:\n" + '\n'.join(errors)
+        
         logger.info("All uploads completed successfully")
         return True, "File upload completed successfully"
 
@@ -392,7 +637,12 @@ class NaviUploaderGUI:
         """Test AWS S3 connection"""
         self.save_configuration(show_dialog=False)  # Save current config first (silently)
         
-        if self.uploader.setup_aws_client():
+        connected = self.uploader.setup_aws_client()
+        if self.uploader.unreachable_destinations:
+            unreachable = '\n'.join(self.uploader.unreachable_destinations)
+            messagebox.showerror("Error", f"Failed to connect to server:\n{unreachable}\n"
+                                          "Please check your credentials and destination settings.")
+        elif connected:
             messagebox.showinfo("Success", "Server connection successful!")
         else:
             messagebox.showerror("Error", "Failed to connect to server. Please check your credentials.")